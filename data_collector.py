@@ -6,22 +6,734 @@
 """
 
 import requests
+import atexit
 import json
 import csv
+import copy
 import os
+import random
+import re
 import time
 import logging
+import logging.handlers
+import operator
+import queue
+import socket
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from itertools import islice
+from typing import Dict, List, Any, Iterator
 import schedule
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+LOGGER_NAME = 'data_collector'
+
+
+class JsonLogFormatter(logging.Formatter):
+    """结构化日志格式：每条记录输出一行JSON，附带记录的 fields 字段"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RepeatSampler(logging.Filter):
+    """重复日志采样：同一位置、同一消息模板在间隔内只输出一条
+
+    按未格式化的消息模板判断重复，因此只对使用 %s 延迟参数的日志有效；
+    WARNING及以上级别和结构化采集记录不采样。被省略的条数附加在下一条输出的日志中。
+    """
+    
+    def __init__(self, interval_seconds: float):
+        super().__init__()
+        self.interval = interval_seconds
+        self._last_emitted = {}
+        self._suppressed = {}
+        self._last_decision = (None, True)
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        # 同一条记录经过多个处理器时沿用第一次的判断
+        if self._last_decision[0] is record:
+            return self._last_decision[1]
+        decision = self._sample(record)
+        self._last_decision = (record, decision)
+        return decision
+    
+    def _sample(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or getattr(record, 'fields', None):
+            return True
+        key = (record.name, record.pathname, record.lineno, record.msg)
+        now = record.created
+        if now - self._last_emitted.get(key, float('-inf')) < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+        self._last_emitted[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.msg = f"{record.msg} (已省略 {suppressed} 条重复日志)"
+        return True
+
+
+def replace_file(src: str, dst: str, retries: int = 5, delay: float = 0.2):
+    """os.replace，目标文件被其他进程短暂占用时重试
+
+    Windows下目标文件被其他进程（报表、回放、杀毒软件等）打开时替换会失败，
+    稍等后重试；多次仍失败时抛出最后一次的 OSError。
+    """
+    for attempt in range(retries):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == retries - 1:
+                raise
+            time.sleep(delay)
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """异步日志入队处理器：入队时只合并消息参数，异常信息原样保留
+
+    标准 QueueHandler 会把异常堆栈拼进消息文本，结构化日志因此缺少单独的 exc 字段；
+    这里把异常留给后台线程中的处理器按各自格式输出，与同步模式一致。
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+@contextmanager
+def atomic_open(filepath: str, newline: str = None, encoding: str = 'utf-8'):
+    """以"先写临时文件再重命名"的方式覆盖写入文件
+
+    写入过程中进程被终止时，原文件保持不变，只会遗留一个 .tmp 临时文件。
+    """
+    tmp_filepath = f"{filepath}.tmp"
+    try:
+        with open(tmp_filepath, 'w', newline=newline, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        replace_file(tmp_filepath, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_filepath)
+        except OSError:
+            pass
+        raise
+
+
+def merge_config(defaults: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """把 overrides 按键递归合并到 defaults（原地修改）：字典逐键合并，其他值（含列表）直接覆盖"""
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(defaults.get(key), dict):
+            merge_config(defaults[key], value)
+        else:
+            defaults[key] = value
+    return defaults
+
+
+def iter_json_array(filepath: str, chunk_size: int = 65536) -> Iterator[Any]:
+    """增量解析JSON数组文件，逐个产出数组元素
+
+    按块读取文件并用raw_decode逐个解码元素，内存占用只与单个元素大小相关，
+    不随文件（历史记录条数）增长。兼容旧版非数组的单对象文件。
+    数组缺少结尾的 ] 或末尾元素残缺时，产出所有完整元素后抛出 ValueError。
+    """
+    decoder = json.JSONDecoder()
+    # 文件末尾被截断的多字节字符替换后按残缺元素处理，不影响之前的完整元素
+    with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+        buffer, pos, eof = '', 0, False
+        in_array = None
+        while True:
+            need_more = False
+            # 跳过空白、BOM和元素分隔符
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] in ',\ufeff'):
+                pos += 1
+
+            if pos >= len(buffer):
+                need_more = True
+            elif in_array is None:
+                in_array = buffer[pos] == '['
+                if in_array:
+                    pos += 1
+                continue
+            elif in_array and buffer[pos] == ']':
+                return
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                    # 解码恰好停在缓冲区末尾时，元素可能被截断（如数字），需继续读取确认
+                    if end == len(buffer) and not eof:
+                        need_more = True
+                    else:
+                        yield item
+                        pos = end
+                        if not in_array:
+                            return
+                        continue
+                except json.JSONDecodeError:
+                    need_more = True
+
+            if need_more:
+                if eof:
+                    if buffer[pos:].strip() or in_array:
+                        raise ValueError(f"JSON数组不完整或已损坏: {filepath}")
+                    return
+                # 按已缓冲长度倍增读取量，避免大元素反复解码
+                chunk = f.read(max(chunk_size, len(buffer) - pos))
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+
+
+def rewrite_json_array(filepath: str, select) -> int:
+    """流式重写JSON数组文件，只保留 select(元素迭代器) 产出的元素，返回保留条数
+
+    先读完源文件并关闭，再用临时文件替换（Windows下无法替换仍被打开的文件）。
+    """
+    kept = 0
+    with atomic_open(filepath) as out:
+        with closing(iter_json_array(filepath)) as items:
+            out.write('[')
+            for item in select(items):
+                out.write(',\n' if kept else '\n')
+                out.write(json.dumps(item, ensure_ascii=False, indent=2))
+                kept += 1
+            out.write('\n]')
+    return kept
+
+
+def read_first_record(filepath: str) -> Any:
+    """读取数据文件的第一条记录，文件不存在、为空或无法解析时返回None"""
+    if not os.path.exists(filepath):
+        return None
+    try:
+        with closing(iter_records(filepath)) as records:
+            return next(records, None)
+    except ValueError:
+        return None
+
+
+def prune_csv_rows(filepath: str, column: int, cutoff: str) -> int:
+    """删除CSV中指定列（日期或ISO时间文本）早于cutoff的行，返回删除的行数
+
+    行按时间顺序追加，首行未过期时直接跳过。保留的行先写入临时文件并关闭源文件，
+    再替换原文件（Windows下无法替换仍被打开的文件）。
+    """
+    if not os.path.exists(filepath):
+        return 0
+    with open(filepath, 'r', newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        first_row = next(reader, None)
+    if not first_row or len(first_row) <= column or first_row[column] >= cutoff:
+        return 0
+    
+    removed = 0
+    with atomic_open(filepath, newline='', encoding='utf-8-sig') as dst:
+        with open(filepath, 'r', newline='', encoding='utf-8-sig') as src:
+            reader = csv.reader(src)
+            writer = csv.writer(dst)
+            writer.writerow(next(reader, []))
+            for row in reader:
+                if len(row) > column and row[column] < cutoff:
+                    removed += 1
+                    continue
+                writer.writerow(row)
+    return removed
+
+
+def iter_csv_records(filepath: str) -> Iterator[Dict[str, str]]:
+    """逐行读取CSV文件，以表头为键产出记录"""
+    with open(filepath, 'r', newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+# 按文件扩展名选择记录读取器，新增存储格式时在此注册
+RECORD_READERS = {
+    '.json': iter_json_array,
+    '.csv': iter_csv_records,
+}
+
+
+def iter_records(filepath: str) -> Iterator[Any]:
+    """根据文件格式流式读取记录"""
+    ext = os.path.splitext(filepath)[1].lower()
+    reader = RECORD_READERS.get(ext)
+    if reader is None:
+        raise ValueError(f"不支持的数据文件格式: {filepath}")
+    return reader(filepath)
+
+
+def _to_int(value: Any) -> int:
+    """将CSV/JSON中的计数字段转换为整数"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def progress_point(record: Dict[str, Any]) -> Dict[str, Any]:
+    """将一条分拣进度记录归一化为曲线数据点，无有效数据时返回None
+
+    支持 sorting_progress_{date}.json 中的API快照、summary_stats.csv 中的汇总行
+    和 rollup_hourly.csv / rollup_daily.csv 中的汇总行。
+    """
+    if not isinstance(record, dict):
+        return None
+
+    # 汇总行：取时段内最新值，附带采集次数、完成时间和最高缺货数
+    if '时段' in record:
+        if not record.get('总任务数_最新'):
+            return None
+        return {
+            'timestamp': record.get('最后采集', ''),
+            'target_date': record.get('目标日期', '')[:10],
+            'snapshots': _to_int(record.get('采集次数')),
+            'total': _to_int(record.get('总任务数_最新')),
+            'completed': _to_int(record.get('已完成任务数_最新')),
+            'shortage': _to_int(record.get('缺货任务数_最新')),
+            'peak_shortage': _to_int(record.get('缺货任务数_最大')),
+            'completed_at': record.get('完成时间', ''),
+        }
+
+    if '采集时间' in record:
+        if not record.get('总任务数'):
+            return None
+        return {
+            'timestamp': record['采集时间'],
+            'target_date': record.get('目标日期', '')[:10],
+            'total': _to_int(record.get('总任务数')),
+            'completed': _to_int(record.get('已完成任务数')),
+            'shortage': _to_int(record.get('缺货任务数')),
+        }
+
+    api_data = record.get('data')
+    if record.get('status') != 'success' or not isinstance(api_data, dict) or api_data.get('code') != 0:
+        return None
+    data = api_data.get('data')
+    if not isinstance(data, dict):
+        return None
+
+    # 与parse_statistics一致：优先使用total_schedule，否则累加分类数据
+    total_schedule = data.get('total_schedule') or {}
+    if total_schedule.get('total_count', 0) > 0:
+        total = total_schedule.get('total_count', 0)
+        completed = total_schedule.get('finished_count', 0)
+        shortage = total_schedule.get('out_of_stock_count', 0)
+    else:
+        categories = data.get('category_schedule') or []
+        total = sum(c.get('total_count', 0) for c in categories)
+        completed = sum(c.get('finished_count', 0) for c in categories)
+        shortage = sum(c.get('out_of_stock_count', 0) for c in categories)
+
+    return {
+        'timestamp': record.get('timestamp', ''),
+        'target_date': (record.get('target_date') or '')[:10],
+        'total': total,
+        'completed': completed,
+        'shortage': shortage,
+    }
+
+
+def load_progress_points(filepath: str) -> Dict[str, Any]:
+    """读取单日分拣进度文件的全部曲线数据点（供多进程并行调用）"""
+    points = []
+    error = ''
+    try:
+        for record in iter_records(filepath):
+            point = progress_point(record)
+            if point:
+                points.append(point)
+    except (OSError, ValueError) as e:
+        error = str(e)
+    return {'filepath': filepath, 'points': points, 'error': error}
+
+
+class AlertEngine:
+    """告警规则引擎
+
+    规则在启动时编译一次，并按关联字段建立索引；每次采集只计算快照中发生变化的字段
+    所关联的规则（停滞类规则除外，它们关注的正是字段没有变化）。
+    """
+    
+    OPERATORS = {
+        '>': operator.gt,
+        '>=': operator.ge,
+        '<': operator.lt,
+        '<=': operator.le,
+        '==': operator.eq,
+        '!=': operator.ne,
+    }
+    
+    def __init__(self, config: Dict[str, Any], logger: logging.Logger, data_dir: str):
+        """编译告警规则和输出通道"""
+        self.logger = logger
+        self.data_dir = data_dir
+        self.sinks = config.get('sinks', [{'type': 'log'}])
+        self.default_cooldown = config.get('cooldown_minutes', 30) * 60
+        
+        self._rules_by_field = {}
+        self._every_cycle_rules = []
+        for rule_config in config.get('rules', []):
+            try:
+                rule = self.compile_rule(rule_config)
+            except (KeyError, ValueError) as e:
+                self.logger.error(f"告警规则配置无效，已忽略 {rule_config}: {e}")
+                continue
+            if rule['every_cycle']:
+                self._every_cycle_rules.append(rule)
+            else:
+                for field in rule['fields']:
+                    self._rules_by_field.setdefault(field, []).append(rule)
+        
+        self._previous = {}
+        self._last_fired = {}
+    
+    def compile_rule(self, rule_config: Dict[str, Any]) -> Dict[str, Any]:
+        """将一条规则配置编译为检查函数
+
+        支持的规则类型：
+        - threshold: 字段值满足比较条件，如 shortage_tasks > 100
+        - delta: 字段相对上一次快照的变化量满足比较条件，如缺货数一次增加 >= 10
+        - stall: 分拣进行中（已开始且仍有未完成任务）字段连续 cycles 次采集没有变化，如 completed_tasks 停滞
+        - sorter_missing: 上一次排名中的分拣员从本次排名中消失
+        """
+        rule_type = rule_config.get('type', 'threshold')
+        name = rule_config.get('name', rule_type)
+        
+        if rule_type in ('threshold', 'delta'):
+            field = rule_config['field']
+            op_symbol = rule_config.get('op', '>')
+            if op_symbol not in self.OPERATORS:
+                raise ValueError(f"不支持的比较运算符: {op_symbol}")
+            compare = self.OPERATORS[op_symbol]
+            limit = rule_config['value']
+            
+            if rule_type == 'threshold':
+                def check(snapshot, previous):
+                    value = snapshot[field]
+                    if compare(value, limit):
+                        return [(name, value, f"{field} = {value} ({op_symbol} {limit})")]
+                    return []
+            else:
+                def check(snapshot, previous):
+                    if field not in previous:
+                        return []
+                    change = snapshot[field] - previous[field]
+                    if compare(change, limit):
+                        return [(name, snapshot[field], f"{field} 变化 {change:+} ({previous[field]} → {snapshot[field]})")]
+                    return []
+            return {'name': name, 'fields': [field], 'every_cycle': False, 'check': check, 'config': rule_config}
+        
+        if rule_type == 'stall':
+            field = rule_config['field']
+            cycles = rule_config.get('cycles', 3)
+            unchanged = {'count': 0}
+            
+            def check(snapshot, previous):
+                if field not in snapshot:
+                    return []
+                # 尚未开始分拣或已全部完成时数值不变属正常，不计入停滞
+                in_progress = snapshot.get('uncompleted_tasks', 0) > 0 and snapshot.get('completed_tasks', 0) > 0
+                if not in_progress:
+                    unchanged['count'] = 0
+                elif field in previous and previous[field] == snapshot[field]:
+                    unchanged['count'] += 1
+                else:
+                    unchanged['count'] = 0
+                # 每次停滞只在达到次数时告警一次
+                if unchanged['count'] == cycles:
+                    return [(name, snapshot[field], f"{field} 已连续 {cycles} 次采集停留在 {snapshot[field]}")]
+                return []
+            return {'name': name, 'fields': [field], 'every_cycle': True, 'check': check, 'config': rule_config}
+        
+        if rule_type == 'sorter_missing':
+            def check(snapshot, previous):
+                current = snapshot['sorters']
+                # 排名为空通常是周期尚未开始或接口异常，不视为分拣员掉出
+                if not current or 'sorters' not in previous:
+                    return []
+                return [(f"{name}:{sorter}", previous['sorters'][sorter], f"分拣员 {sorter} 已不在排名中")
+                        for sorter in previous['sorters'] if sorter not in current]
+            return {'name': name, 'fields': ['sorters'], 'every_cycle': False, 'check': check, 'config': rule_config}
+        
+        raise ValueError(f"不支持的规则类型: {rule_type}")
+    
+    def evaluate(self, snapshot: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """根据本次快照及其相对上一次快照的变化计算告警，并发送到各输出通道"""
+        # 目标日期切换后计数从零开始，不与前一天比较
+        if snapshot.get('target_date') != self._previous.get('target_date'):
+            self._previous = {}
+        previous = self._previous
+        
+        changed = [field for field, value in snapshot.items() if previous.get(field) != value]
+        rules = []
+        seen = set()
+        for field in changed:
+            for rule in self._rules_by_field.get(field, ()):
+                if id(rule) not in seen:
+                    seen.add(id(rule))
+                    rules.append(rule)
+        rules.extend(self._every_cycle_rules)
+        
+        # 冷却时间和告警时间以快照采集时间为准，回放历史数据时与实时采集行为一致
+        try:
+            snapshot_time = datetime.fromisoformat(snapshot['timestamp'])
+        except (KeyError, TypeError, ValueError):
+            snapshot_time = datetime.now()
+        now = snapshot_time.timestamp()
+        
+        alerts = []
+        for rule in rules:
+            try:
+                results = rule['check'](snapshot, previous)
+            except (TypeError, KeyError) as e:
+                self.logger.error(f"告警规则 [{rule['name']}] 计算失败: {e}")
+                continue
+            for key, value, message in results:
+                cooldown = rule['config'].get('cooldown_minutes')
+                cooldown = cooldown * 60 if cooldown is not None else self.default_cooldown
+                if now - self._last_fired.get(key, 0) < cooldown:
+                    continue
+                self._last_fired[key] = now
+                alerts.append({
+                    'time': snapshot_time.isoformat(),
+                    'rule': rule['name'],
+                    'level': rule['config'].get('level', 'warning'),
+                    'target_date': snapshot.get('target_date', ''),
+                    'value': value,
+                    'message': message
+                })
+        
+        # 接口失败时快照缺少部分字段，保留这些字段的上一次值；排名为空时同样保留上一次的分拣员，
+        # 否则空排名之后掉出的分拣员无法被发现
+        previous.update((field, value) for field, value in snapshot.items() if field != 'sorters' or value)
+        
+        for alert in alerts:
+            self.dispatch(alert)
+        return alerts
+    
+    def dispatch(self, alert: Dict[str, Any]):
+        """将告警发送到配置的输出通道，单个通道出错不影响其他通道"""
+        for sink in self.sinks:
+            sink_type = sink.get('type', 'log')
+            try:
+                if sink_type == 'log':
+                    self.logger.warning(f"🚨 告警 [{alert['rule']}] {alert['message']}")
+                elif sink_type == 'file':
+                    filepath = os.path.join(self.data_dir, sink.get('filename', 'alerts.csv'))
+                    file_exists = os.path.exists(filepath)
+                    with open(filepath, 'a', newline='', encoding='utf-8-sig') as f:
+                        writer = csv.writer(f)
+                        if not file_exists:
+                            writer.writerow(['告警时间', '规则', '级别', '目标日期', '当前值', '告警信息'])
+                        writer.writerow([alert['time'], alert['rule'], alert['level'],
+                                         alert['target_date'], alert['value'], alert['message']])
+                elif sink_type == 'webhook':
+                    response = requests.post(sink['url'], json=alert, timeout=sink.get('timeout', 5))
+                    response.raise_for_status()
+                else:
+                    self.logger.error(f"不支持的告警输出类型: {sink_type}")
+            except Exception as e:
+                self.logger.error(f"告警发送失败 ({sink_type}): {e}")
+
+
+# 分拣进度分类名称（与 summary_stats.csv 表头一致）
+CATEGORY_NAMES = [
+    '新鲜蔬菜', '新鲜肉类', '鲜活水产', '时令果蔬', '鲜活禽类', '休闲食品', '速冻速食',
+    '南北干货', '厨房酱料', '乳品烘焙', '厨房用品', '米面粮油', '腊味熟食', '其他'
+]
+
+# 汇总层级统计的计数字段及其表头名称
+ROLLUP_COUNTERS = {
+    'total_tasks': '总任务数',
+    'completed_tasks': '已完成任务数',
+    'uncompleted_tasks': '未完成任务数',
+    'shortage_tasks': '缺货任务数',
+}
+ROLLUP_COUNTERS.update({
+    f'{category}_{status}': f'{category}_{status}'
+    for category in CATEGORY_NAMES for status in ('未完成', '已完成', '缺货')
+})
+
+
+class RollupStore:
+    """多级汇总数据（5分钟快照 → 每小时 → 每天）
+
+    每个层级在内存中保留当前时段的汇总，快照进入新时段时把上一时段写入CSV，
+    当前时段状态每次更新后原子写入 rollup_state.json，进程重启后继续累计。
+    长周期趋势查询只需读取 rollup_hourly.csv / rollup_daily.csv。
+    """
+    
+    # 层级名称 -> 由快照计算所属时段
+    TIERS = {
+        'hourly': lambda snapshot: snapshot['timestamp'][:13].replace('T', ' ') + ':00',
+        'daily': lambda snapshot: snapshot['target_date'],
+    }
+    
+    def __init__(self, data_dir: str, logger: logging.Logger):
+        """加载未写出的当前时段状态"""
+        self.data_dir = data_dir
+        self.logger = logger
+        self.state_filepath = os.path.join(data_dir, 'rollup_state.json')
+        self.buckets = {}
+        
+        if os.path.exists(self.state_filepath):
+            try:
+                with open(self.state_filepath, 'r', encoding='utf-8') as f:
+                    self.buckets = json.load(f)
+            except (OSError, ValueError) as e:
+                self.logger.error(f"汇总状态文件读取失败，从当前快照重新开始累计: {e}")
+        
+        # 写出时段后、保存状态前被终止时，该时段已在CSV中，不能重复写出
+        for tier, bucket in list(self.buckets.items()):
+            if bucket and self._last_written_bucket(tier) == bucket['bucket']:
+                self.buckets[tier] = None
+    
+    def tier_filepath(self, tier: str) -> str:
+        return os.path.join(self.data_dir, f"rollup_{tier}.csv")
+    
+    def sorter_filepath(self, tier: str) -> str:
+        return os.path.join(self.data_dir, f"rollup_sorter_{tier}.csv")
+    
+    def _last_written_bucket(self, tier: str) -> str:
+        """读取层级CSV最后一行的时段（只读取文件末尾）"""
+        filepath = self.tier_filepath(tier)
+        if not os.path.exists(filepath):
+            return ''
+        with open(filepath, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 65536))
+            lines = f.read().decode('utf-8-sig', errors='replace').strip().splitlines()
+        return lines[-1].split(',', 1)[0] if lines else ''
+    
+    def add(self, snapshot: Dict[str, Any]) -> List[str]:
+        """把一次快照累计到各层级，返回本次写出了上一时段的层级"""
+        flushed = []
+        for tier, bucket_of in self.TIERS.items():
+            key = bucket_of(snapshot)
+            bucket = self.buckets.get(tier)
+            if bucket and bucket['bucket'] != key:
+                self._write_bucket(tier, bucket)
+                flushed.append(tier)
+                # 同一目标日期内，新增件数以上一时段最终值为基准，完成时间沿用当天首次完成的时间
+                carried = bucket if bucket['target_date'] == snapshot['target_date'] else None
+                bucket = None
+            else:
+                carried = None
+            if not bucket:
+                bucket = {
+                    'bucket': key,
+                    'target_date': snapshot['target_date'],
+                    'snapshots': 0,
+                    'first_time': snapshot['timestamp'],
+                    'last_time': snapshot['timestamp'],
+                    'completed_at': carried['completed_at'] if carried else '',
+                    'counters': {},
+                    'sorters': {},
+                    'sorter_base': carried['sorters'] if carried else {},
+                }
+                self.buckets[tier] = bucket
+            self._update_bucket(bucket, snapshot)
+        
+        with atomic_open(self.state_filepath) as f:
+            json.dump(self.buckets, f, ensure_ascii=False)
+        return flushed
+    
+    def _update_bucket(self, bucket: Dict[str, Any], snapshot: Dict[str, Any]):
+        """用快照更新时段内每个计数的最小/最大/最新值"""
+        bucket['snapshots'] += 1
+        bucket['last_time'] = snapshot['timestamp']
+        
+        counters = bucket['counters']
+        for field in ROLLUP_COUNTERS:
+            value = snapshot.get(field)
+            if value is None:
+                continue
+            if field in counters:
+                low, high, _ = counters[field]
+                counters[field] = [min(low, value), max(high, value), value]
+            else:
+                counters[field] = [value, value, value]
+        
+        # 目标日期内未完成任务首次清零的时间
+        total = snapshot.get('total_tasks', 0)
+        if not bucket['completed_at'] and total > 0 \
+                and snapshot.get('completed_tasks', 0) + snapshot.get('shortage_tasks', 0) >= total:
+            bucket['completed_at'] = snapshot['timestamp'][11:16]
+        
+        if 'sorters' in snapshot:
+            bucket['sorters'].update(snapshot['sorters'])
+    
+    def _write_bucket(self, tier: str, bucket: Dict[str, Any]):
+        """追加写出一个已结束的时段"""
+        filepath = self.tier_filepath(tier)
+        file_exists = os.path.exists(filepath)
+        with open(filepath, 'a', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            if not file_exists:
+                headers = ['时段', '目标日期', '采集次数', '首次采集', '最后采集', '完成时间']
+                for label in ROLLUP_COUNTERS.values():
+                    headers += [f'{label}_最小', f'{label}_最大', f'{label}_最新']
+                writer.writerow(headers)
+            
+            row = [bucket['bucket'], bucket['target_date'], bucket['snapshots'],
+                   bucket['first_time'], bucket['last_time'], bucket['completed_at']]
+            for field in ROLLUP_COUNTERS:
+                row += bucket['counters'].get(field, ['', '', ''])
+            writer.writerow(row)
+        
+        if not bucket['sorters']:
+            return
+        
+        filepath = self.sorter_filepath(tier)
+        file_exists = os.path.exists(filepath)
+        with open(filepath, 'a', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            if not file_exists:
+                writer.writerow(['时段', '目标日期', '分拣员姓名', '完成件数', '本时段新增'])
+            for name, count in sorted(bucket['sorters'].items(), key=lambda item: item[1], reverse=True):
+                writer.writerow([bucket['bucket'], bucket['target_date'], name, count,
+                                 count - bucket['sorter_base'].get(name, 0)])
+    
+    def prune(self, tier: str, cutoff_date: str) -> int:
+        """删除层级CSV中目标日期早于cutoff_date的行，返回删除的行数"""
+        return sum(prune_csv_rows(filepath, 1, cutoff_date)
+                   for filepath in (self.tier_filepath(tier), self.sorter_filepath(tier)))
+
+
 class DataCollector:
+    # 按键深度合并用户配置的配置段
+    MERGED_CONFIG_SECTIONS = ('report', 'replay', 'rollup')
+    
     def __init__(self, config_file='config.json'):
         """初始化数据采集器"""
         self.config = self.load_config(config_file)
         self.setup_logging()
         self.session = requests.Session()
         self.setup_session()
+        self.setup_alerts()
+        self.setup_rollups()
         
     def load_config(self, config_file: str) -> Dict[str, Any]:
         """加载配置文件"""
@@ -59,6 +771,44 @@ class DataCollector:
             "retry": {
                 "max_attempts": 3,
                 "delay_seconds": 5
+            },
+            "report": {
+                "workers": 0,
+                "top_n": 10
+            },
+            "logging": {
+                "mode": "text",
+                "async": False,
+                "level": "INFO",
+                "levels": {},
+                "sample_interval_seconds": 0
+            },
+            "replay": {
+                "output_dir": "replay_data",
+                "speed": 0,
+                "stations": 1,
+                "log_cycles": False
+            },
+            "rollup": {
+                "enabled": True,
+                "retention_days": {
+                    "raw": 0,
+                    "hourly": 365,
+                    "daily": 0
+                }
+            },
+            "alerts": {
+                "enabled": False,
+                "cooldown_minutes": 30,
+                "sinks": [
+                    {"type": "log"},
+                    {"type": "file", "filename": "alerts.csv"}
+                ],
+                "rules": [
+                    {"name": "缺货激增", "type": "delta", "field": "shortage_tasks", "op": ">=", "value": 10},
+                    {"name": "分拣停滞", "type": "stall", "field": "completed_tasks", "cycles": 3},
+                    {"name": "分拣员掉出排名", "type": "sorter_missing"}
+                ]
             }
         }
         
@@ -66,34 +816,313 @@ class DataCollector:
             try:
                 with open(config_file, 'r', encoding='utf-8') as f:
                     user_config = json.load(f)
-                    # 合并配置
-                    default_config.update(user_config)
+                    # 合并配置：新增功能的配置段按键深度合并，只填写部分键时其余键保持默认值
+                    for section, value in user_config.items():
+                        if section in self.MERGED_CONFIG_SECTIONS and isinstance(value, dict):
+                            merge_config(default_config[section], value)
+                        else:
+                            default_config[section] = value
             except Exception as e:
                 print(f"配置文件加载失败，使用默认配置: {e}")
         
         return default_config
     
     def setup_logging(self):
-        """设置日志记录"""
+        """设置日志记录
+
+        logging 配置项：
+        - mode: text 为逐行可读日志；structured 为JSON行日志，每次采集只输出一条汇总记录
+        - async: 日志经队列交给后台线程写入文件和控制台，不阻塞采集
+        - levels: 按日志器设置级别，如 {"data_collector.http": "WARNING"}
+        - sample_interval_seconds: 重复日志采样间隔，0表示不采样
+        """
         log_dir = self.config['collection']['data_dir']
         os.makedirs(log_dir, exist_ok=True)
         
         log_file = os.path.join(log_dir, self.config['collection']['log_filename'])
+        log_config = self.config['logging']
+        self.structured_logs = log_config.get('mode') == 'structured'
         
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
+        if not logging.root.handlers:
+            if self.structured_logs:
+                formatter = JsonLogFormatter()
+            else:
+                formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+            handlers = [
                 logging.FileHandler(log_file, encoding='utf-8'),
                 logging.StreamHandler()
             ]
-        )
-        self.logger = logging.getLogger(__name__)
+            for handler in handlers:
+                handler.setFormatter(formatter)
+            
+            if log_config.get('async'):
+                log_queue = queue.SimpleQueue()
+                listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+                listener.start()
+                atexit.register(listener.stop)
+                handlers = [LogQueueHandler(log_queue)]
+            
+            if log_config.get('sample_interval_seconds'):
+                sampler = RepeatSampler(log_config['sample_interval_seconds'])
+                for handler in handlers:
+                    handler.addFilter(sampler)
+            
+            logging.basicConfig(level=log_config.get('level', 'INFO'), handlers=handlers)
+        
+        # 结构化模式下请求细节和文件保存日志默认只输出警告及以上级别
+        levels = {}
+        if self.structured_logs:
+            levels = {f"{LOGGER_NAME}.http": 'WARNING', f"{LOGGER_NAME}.storage": 'WARNING'}
+        levels.update(log_config.get('levels', {}))
+        for name, level in levels.items():
+            logging.getLogger(name).setLevel(level)
+        
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.http_logger = logging.getLogger(f"{LOGGER_NAME}.http")
+        self.storage_logger = logging.getLogger(f"{LOGGER_NAME}.storage")
     
     def setup_session(self):
         """设置请求会话"""
         self.session.headers.update(self.config['api']['headers'])
     
+    def setup_alerts(self):
+        """按配置编译告警规则"""
+        alert_config = self.config['alerts']
+        if alert_config.get('enabled'):
+            self.alert_engine = AlertEngine(alert_config, self.logger, self.config['collection']['data_dir'])
+        else:
+            self.alert_engine = None
+    
+    def setup_rollups(self):
+        """按配置加载多级汇总数据"""
+        if self.config['rollup'].get('enabled'):
+            self.rollup_store = RollupStore(self.config['collection']['data_dir'], self.logger)
+        else:
+            self.rollup_store = None
+    
+    def build_snapshot(self, data: Dict[str, Any], stats: Dict[str, Any],
+                       sorter_rank_data: Dict[str, Any]) -> Dict[str, Any]:
+        """把本次采集的统计结果和分拣员排名合并为一个快照，采集失败的数据源不参与"""
+        snapshot = {}
+        if data['status'] == 'success' and stats:
+            snapshot.update(stats)
+            snapshot['timestamp'] = data['timestamp']
+            snapshot['target_date'] = data['target_date'][:10]
+        
+        api_data = sorter_rank_data.get('data', {})
+        if sorter_rank_data['status'] == 'success' and api_data.get('code') == 0 \
+                and isinstance(api_data.get('data'), list):
+            sorters = {sorter.get('sorter_name', ''): sorter.get('statistic_results', 0) for sorter in api_data['data']}
+            snapshot['sorters'] = sorters
+            snapshot['sorter_count'] = len(sorters)
+            snapshot['sorter_total'] = sum(sorters.values())
+            snapshot.setdefault('timestamp', sorter_rank_data['timestamp'])
+            snapshot.setdefault('target_date', sorter_rank_data['cycle_start_time'][:10])
+        
+        return snapshot
+    
+    def evaluate_alerts(self, snapshot: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """用本次采集快照计算告警"""
+        if self.alert_engine is None or not snapshot:
+            return []
+        return self.alert_engine.evaluate(snapshot)
+    
+    def update_rollups(self, snapshot: Dict[str, Any]):
+        """把本次采集快照累计到多级汇总，每天结束时执行一次数据保留清理"""
+        if self.rollup_store is None or not snapshot:
+            return
+        try:
+            flushed = self.rollup_store.add(snapshot)
+            if 'daily' in flushed:
+                # 以数据自身时间计算保留期限，回放历史数据时不会误删刚回放的数据
+                self.apply_retention(datetime.fromisoformat(snapshot['timestamp']))
+        except (OSError, ValueError) as e:
+            self.logger.error(f"更新汇总数据失败: {e}")
+    
+    def apply_retention(self, reference_time: datetime = None):
+        """按各层级保留天数删除过期数据（0表示永久保留），期限从 reference_time（默认当前时间）起算
+
+        raw 层级对应全部5分钟原始数据：按日存储的 sorting_progress_{date}.json 文件，
+        raw_data.csv、summary_stats.csv、sorter_rank_detail.csv、sorter_rank_summary.csv 中的行，
+        以及 sorter_rank.json 中的记录。
+        """
+        retention = self.config['rollup']['retention_days']
+        today = reference_time or datetime.now()
+        data_dir = self.config['collection']['data_dir']
+        
+        raw_days = retention.get('raw', 0)
+        if raw_days:
+            cutoff = (today - timedelta(days=raw_days)).strftime('%Y-%m-%d')
+            expired = self.list_progress_files(end=(today - timedelta(days=raw_days + 1)).strftime('%Y-%m-%d'))
+            for filepath in expired:
+                os.remove(filepath)
+            if expired:
+                self.storage_logger.info("已删除 %d 个早于 %s 的原始快照文件", len(expired), cutoff)
+            
+            for name in ('raw_data.csv', 'summary_stats.csv', 'sorter_rank_detail.csv', 'sorter_rank_summary.csv'):
+                removed = prune_csv_rows(os.path.join(data_dir, name), 0, cutoff)
+                if removed:
+                    self.storage_logger.info("已删除 %s 中 %d 行早于 %s 的记录", name, removed, cutoff)
+            
+            rank_filepath = os.path.join(data_dir, 'sorter_rank.json')
+            first = read_first_record(rank_filepath)
+            if isinstance(first, dict) and first.get('timestamp', '') < cutoff:
+                kept = rewrite_json_array(
+                    rank_filepath, lambda items: (item for item in items if item.get('timestamp', '') >= cutoff))
+                self.storage_logger.info("已清理 sorter_rank.json 中早于 %s 的记录，保留 %d 条", cutoff, kept)
+        
+        for tier in RollupStore.TIERS:
+            days = retention.get(tier, 0)
+            if not days:
+                continue
+            cutoff = (today - timedelta(days=days)).strftime('%Y-%m-%d')
+            removed = self.rollup_store.prune(tier, cutoff)
+            if removed:
+                self.storage_logger.info("已删除 %d 行早于 %s 的%s汇总数据", removed, cutoff, tier)
+    
+    def acquire_lock(self) -> bool:
+        """获取数据目录的独占锁，成功后执行一次数据文件恢复检查
+
+        使用操作系统文件锁：持有锁的进程退出（包括崩溃、被强制结束）后锁自动释放，
+        遗留的锁文件不会阻止下次启动，新进程会直接接管并记录上一持有者信息。
+        """
+        data_dir = self.config['collection']['data_dir']
+        os.makedirs(data_dir, exist_ok=True)
+        lock_filepath = os.path.join(data_dir, 'collector.lock')
+        
+        lock_file = open(lock_filepath, 'a+', encoding='utf-8')
+        try:
+            lock_file.seek(0)
+            previous_holder = lock_file.read().strip()
+        except OSError:
+            # Windows下被其他进程锁定的区域不可读
+            previous_holder = ''
+        try:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            self.logger.error(f"数据目录已被其他采集进程占用 ({previous_holder or lock_filepath})，本进程退出")
+            return False
+        
+        if previous_holder:
+            self.logger.warning(f"检测到残留锁文件，上一采集进程未正常退出，已接管: {previous_holder}")
+        
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"pid={os.getpid()} host={socket.gethostname()} started={datetime.now().isoformat()}")
+        lock_file.flush()
+        self._lock_file = lock_file
+        atexit.register(self.release_lock)
+        
+        self.recover_data_files()
+        return True
+    
+    def release_lock(self):
+        """释放数据目录锁
+
+        正常退出时清空锁文件内容（不删除文件，避免与正在获取锁的进程竞争），
+        下次启动时锁文件有内容即说明上一进程异常退出。
+        """
+        lock_file = getattr(self, '_lock_file', None)
+        if lock_file is None:
+            return
+        
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.close()
+        self._lock_file = None
+    
+    def recover_data_files(self) -> Dict[str, int]:
+        """启动时检查数据文件，修复进程中途被终止留下的残缺记录
+
+        - 删除采集进程自身遗留的 .tmp 临时文件（报表文件不加锁生成，其临时文件不处理）
+        - CSV文件：截断末尾不完整的行
+        - JSON数组文件：保留所有完整元素，丢弃末尾残缺元素后重新写入
+        """
+        data_dir = self.config['collection']['data_dir']
+        result = {'tmp_removed': 0, 'csv_repaired': 0, 'json_repaired': 0}
+        
+        for name in sorted(os.listdir(data_dir)):
+            filepath = os.path.join(data_dir, name)
+            if not os.path.isfile(filepath):
+                continue
+            try:
+                if name.endswith('.tmp'):
+                    if name.startswith('report_'):
+                        continue
+                    os.remove(filepath)
+                    result['tmp_removed'] += 1
+                    self.logger.warning(f"已删除未完成写入的临时文件: {filepath}")
+                elif name.endswith('.csv'):
+                    removed = self._truncate_torn_csv(filepath)
+                    if removed:
+                        result['csv_repaired'] += 1
+                        self.logger.warning(f"已截断CSV文件末尾不完整记录 ({removed} 字节): {filepath}")
+                elif name.endswith('.json'):
+                    dropped = self._repair_torn_json(filepath)
+                    if dropped is not None:
+                        result['json_repaired'] += 1
+                        self.logger.warning(f"已修复JSON文件末尾残缺记录，保留 {dropped} 条完整记录: {filepath}")
+            except (OSError, ValueError) as e:
+                self.logger.error(f"检查数据文件失败 {filepath}: {e}")
+        
+        return result
+    
+    def _truncate_torn_csv(self, filepath: str) -> int:
+        """将CSV文件截断到最后一个完整行，返回删除的字节数"""
+        with open(filepath, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return 0
+            
+            # 从文件末尾向前查找最后一个换行符
+            pos = size
+            while pos > 0:
+                block_start = max(0, pos - 4096)
+                f.seek(block_start)
+                block = f.read(pos - block_start)
+                newline_index = block.rfind(b'\n')
+                if newline_index >= 0:
+                    keep = block_start + newline_index + 1
+                    break
+                pos = block_start
+            else:
+                keep = 0
+            
+            if keep == size:
+                return 0
+            f.truncate(keep)
+        
+        # 只剩残缺表头时删除文件，下次保存会重新写入表头
+        if keep == 0:
+            os.remove(filepath)
+        return size - keep
+    
+    def _repair_torn_json(self, filepath: str) -> int:
+        """修复末尾残缺的JSON数组文件，返回保留的记录数；文件完整时返回None"""
+        with open(filepath, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 64))
+            tail = f.read().rstrip()
+        # json.dump(indent=2)写出的数组以独占一行的 ] 结尾，内层的 ] 都带缩进
+        if size == 0 or tail.endswith(b'\n]') or tail == b'[]':
+            return None
+        
+        # 格式不符时逐条解析确认是否真的残缺
+        kept = 0
+        try:
+            for _ in iter_json_array(filepath):
+                kept += 1
+            return None
+        except ValueError:
+            pass
+        
+        return rewrite_json_array(filepath, lambda items: islice(items, kept))
+    
     def get_target_date(self, offset_days: int = 0) -> str:
         """获取目标日期字符串
         
@@ -107,11 +1136,11 @@ class DataCollector:
         if now.hour >= 18:
             # 18点后，请求次日数据
             target_date = now + timedelta(days=1 + offset_days)
-            self.logger.info(f"当前时间 {now.strftime('%H:%M')} 已过18点，请求次日数据: {target_date.strftime('%Y-%m-%d')}")
+            self.http_logger.info("当前时间 %s 已过18点，请求次日数据: %s", now.strftime('%H:%M'), target_date.date())
         else:
             # 18点前，请求当天数据
             target_date = now + timedelta(days=offset_days)
-            self.logger.info(f"当前时间 {now.strftime('%H:%M')} 未过18点，请求当天数据: {target_date.strftime('%Y-%m-%d')}")
+            self.http_logger.info("当前时间 %s 未过18点，请求当天数据: %s", now.strftime('%H:%M'), target_date.date())
         
         return target_date.strftime('%Y-%m-%d 00:00:00')
     
@@ -128,15 +1157,15 @@ class DataCollector:
 
         for attempt in range(self.config['retry']['max_attempts']):
             try:
-                self.logger.info(f"正在获取数据 (尝试 {attempt + 1}/{self.config['retry']['max_attempts']})")
-                self.logger.info(f"请求URL: {url}")
-                self.logger.info(f"请求参数: {params}")
+                self.http_logger.info("正在获取数据 (尝试 %d/%d)", attempt + 1, self.config['retry']['max_attempts'])
+                self.http_logger.info("请求URL: %s", url)
+                self.http_logger.info("请求参数: %s", params)
 
                 response = self.session.get(url, params=params, timeout=30)
                 response.raise_for_status()
 
                 data = response.json()
-                self.logger.info(f"数据获取成功，响应大小: {len(response.text)} 字符")
+                self.http_logger.info("数据获取成功，响应大小: %d 字节", len(response.content))
                 return {
                     'timestamp': datetime.now().isoformat(),
                     'target_date': target_date,
@@ -145,7 +1174,7 @@ class DataCollector:
                 }
 
             except requests.exceptions.RequestException as e:
-                self.logger.error(f"请求失败 (尝试 {attempt + 1}): {e}")
+                self.http_logger.error("请求失败 (尝试 %d): %s", attempt + 1, e)
                 if attempt < self.config['retry']['max_attempts'] - 1:
                     time.sleep(self.config['retry']['delay_seconds'])
                 else:
@@ -156,7 +1185,7 @@ class DataCollector:
                         'status': 'failed'
                     }
             except json.JSONDecodeError as e:
-                self.logger.error(f"JSON解析失败: {e}")
+                self.http_logger.error("JSON解析失败: %s", e)
                 return {
                     'timestamp': datetime.now().isoformat(),
                     'target_date': target_date,
@@ -176,11 +1205,11 @@ class DataCollector:
             if now.hour >= 18:
                 # 18点后，查询次日的5:00-9:00数据
                 target_date = (now + timedelta(days=1)).strftime('%Y-%m-%d')
-                self.logger.info(f"当前时间 {now.strftime('%H:%M')} 已过18点，查询次日分拣员排名数据: {target_date}")
+                self.http_logger.info("当前时间 %s 已过18点，查询次日分拣员排名数据: %s", now.strftime('%H:%M'), target_date)
             else:
                 # 18点前，查询当天的5:00-9:00数据
                 target_date = now.strftime('%Y-%m-%d')
-                self.logger.info(f"当前时间 {now.strftime('%H:%M')} 未过18点，查询当天分拣员排名数据: {target_date}")
+                self.http_logger.info("当前时间 %s 未过18点，查询当天分拣员排名数据: %s", now.strftime('%H:%M'), target_date)
             
             cycle_start_time = f"{target_date} 05:00"
             cycle_end_time = f"{target_date} 09:00"
@@ -194,21 +1223,22 @@ class DataCollector:
 
         for attempt in range(self.config['retry']['max_attempts']):
             try:
-                self.logger.info(f"正在获取分拣员排名数据 (尝试 {attempt + 1}/{self.config['retry']['max_attempts']})")
-                self.logger.info(f"请求URL: {url}")
-                self.logger.info(f"请求参数: {params}")
+                self.http_logger.info("正在获取分拣员排名数据 (尝试 %d/%d)", attempt + 1, self.config['retry']['max_attempts'])
+                self.http_logger.info("请求URL: %s", url)
+                self.http_logger.info("请求参数: %s", params)
 
                 response = self.session.get(url, params=params, timeout=30)
                 response.raise_for_status()
 
                 data = response.json()
-                self.logger.info(f"分拣员排名数据获取成功，响应大小: {len(response.text)} 字符")
+                self.http_logger.info("分拣员排名数据获取成功，响应大小: %d 字节", len(response.content))
                 
                 # 统计排名数据
-                if data.get('code') == 0 and isinstance(data.get('data'), list):
+                if self.http_logger.isEnabledFor(logging.INFO) and data.get('code') == 0 \
+                        and isinstance(data.get('data'), list):
                     sorter_count = len(data['data'])
                     total_results = sum(item.get('statistic_results', 0) for item in data['data'])
-                    self.logger.info(f"获取到 {sorter_count} 名分拣员排名数据，总计完成 {total_results} 件")
+                    self.http_logger.info("获取到 %d 名分拣员排名数据，总计完成 %s 件", sorter_count, total_results)
                 
                 return {
                     'timestamp': datetime.now().isoformat(),
@@ -219,7 +1249,7 @@ class DataCollector:
                 }
 
             except requests.exceptions.RequestException as e:
-                self.logger.error(f"分拣员排名数据请求失败 (尝试 {attempt + 1}): {e}")
+                self.http_logger.error("分拣员排名数据请求失败 (尝试 %d): %s", attempt + 1, e)
                 if attempt < self.config['retry']['max_attempts'] - 1:
                     time.sleep(self.config['retry']['delay_seconds'])
                 else:
@@ -231,7 +1261,7 @@ class DataCollector:
                         'status': 'failed'
                     }
             except json.JSONDecodeError as e:
-                self.logger.error(f"分拣员排名数据JSON解析失败: {e}")
+                self.http_logger.error("分拣员排名数据JSON解析失败: %s", e)
                 return {
                     'timestamp': datetime.now().isoformat(),
                     'cycle_start_time': cycle_start_time,
@@ -240,6 +1270,35 @@ class DataCollector:
                     'status': 'failed'
                 }
     
+    def append_to_json_array(self, filepath: str, data: Dict[str, Any]) -> bool:
+        """把一条记录追加到JSON数组文件（整体重写，原子替换）
+
+        已有文件无法解析时不覆盖：先把原文件改名为 .corrupt 备份保留，再从本条记录开始新文件。
+        文件暂时无法读取或替换（被其他进程占用等）时跳过本次追加，返回 False，不影响采集继续运行。
+        """
+        existing_data = []
+        try:
+            if os.path.exists(filepath):
+                try:
+                    with open(filepath, 'r', encoding='utf-8') as f:
+                        existing_data = json.load(f)
+                    if not isinstance(existing_data, list):
+                        existing_data = [existing_data]
+                except ValueError as e:
+                    backup_filepath = f"{filepath}.{datetime.now().strftime('%Y%m%d%H%M%S')}.corrupt"
+                    replace_file(filepath, backup_filepath)
+                    self.storage_logger.error("JSON文件无法解析，已将原文件移至 %s 保留，新记录写入新文件: %s",
+                                              backup_filepath, e)
+                    existing_data = []
+            
+            existing_data.append(data)
+            with atomic_open(filepath) as f:
+                json.dump(existing_data, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            self.storage_logger.error("JSON文件暂时无法读写，跳过本次追加: %s", e)
+            return False
+        return True
+    
     def save_sorter_rank_to_json(self, data: Dict[str, Any], date_str: str = None):
         """保存分拣员排名数据到JSON文件"""
         data_dir = self.config['collection']['data_dir']
@@ -248,23 +1307,8 @@ class DataCollector:
         filename = "sorter_rank.json"
         filepath = os.path.join(data_dir, filename)
         
-        # 如果文件存在，追加到数组中
-        if os.path.exists(filepath):
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                if not isinstance(existing_data, list):
-                    existing_data = [existing_data]
-                existing_data.append(data)
-            except:
-                existing_data = [data]
-        else:
-            existing_data = [data]
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(existing_data, f, ensure_ascii=False, indent=2)
-        
-        self.logger.info(f"分拣员排名数据已保存到JSON文件: {filepath}")
+        if self.append_to_json_array(filepath, data):
+            self.storage_logger.info("分拣员排名数据已保存到JSON文件: %s", filepath)
     
     def save_sorter_rank_to_csv(self, data: Dict[str, Any], date_str: str = None):
         """保存分拣员排名数据到CSV文件"""
@@ -363,10 +1407,10 @@ class DataCollector:
                 ]
                 writer.writerow(row)
             
-            self.logger.info(f"分拣员排名数据已保存到CSV文件: {detail_filepath} 和 {summary_filepath}")
+            self.storage_logger.info("分拣员排名数据已保存到CSV文件: %s 和 %s", detail_filepath, summary_filepath)
             
         except Exception as e:
-            self.logger.error(f"保存分拣员排名CSV数据时出错: {e}")
+            self.storage_logger.error("保存分拣员排名CSV数据时出错: %s", e)
     
     def save_to_json(self, data: Dict[str, Any], date_str: str = None):
         """保存数据到JSON文件"""
@@ -376,23 +1420,8 @@ class DataCollector:
         filename = self.config['collection']['json_filename'].format(date=date_str)
         filepath = os.path.join(data_dir, filename)
         
-        # 如果文件存在，追加到数组中
-        if os.path.exists(filepath):
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                if not isinstance(existing_data, list):
-                    existing_data = [existing_data]
-                existing_data.append(data)
-            except:
-                existing_data = [data]
-        else:
-            existing_data = [data]
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(existing_data, f, ensure_ascii=False, indent=2)
-        
-        self.logger.info(f"数据已保存到JSON文件: {filepath}")
+        if self.append_to_json_array(filepath, data):
+            self.storage_logger.info("数据已保存到JSON文件: %s", filepath)
     
     def save_to_csv(self, data: Dict[str, Any], date_str: str = None):
         """保存数据到CSV文件"""
@@ -514,12 +1543,12 @@ class DataCollector:
                         empty_row = [data['timestamp'], data['target_date']] + [''] * (len(summary_headers) - 2)
                         writer.writerow(empty_row)
             
-            self.logger.info(f"数据已保存到CSV文件: {raw_filepath}")
+            self.storage_logger.info("数据已保存到CSV文件: %s", raw_filepath)
             if data['status'] == 'success':
-                self.logger.info(f"统计数据已保存到: {summary_filepath}")
+                self.storage_logger.info("统计数据已保存到: %s", summary_filepath)
             
         except Exception as e:
-            self.logger.error(f"保存CSV文件失败: {e}")
+            self.storage_logger.error("保存CSV文件失败: %s", e)
     
     def parse_statistics(self, api_data: Dict[str, Any]) -> Dict[str, Any]:
         """解析API响应数据，提取统计信息"""
@@ -615,7 +1644,9 @@ class DataCollector:
                 if stats['weight_tasks'] > 0 and stats['total_weight'] > 0:
                     stats['avg_weight'] = round(stats['total_weight'] / stats['weight_tasks'], 2)
                 
-                self.logger.info(f"成功解析统计数据: 总任务{stats['total_tasks']}, 已完成{stats['completed_tasks']}, 未完成{stats['uncompleted_tasks']}, 缺货{stats['shortage_tasks']}")
+                self.logger.debug("成功解析统计数据: 总任务%s, 已完成%s, 未完成%s, 缺货%s",
+                                  stats['total_tasks'], stats['completed_tasks'],
+                                  stats['uncompleted_tasks'], stats['shortage_tasks'])
             
         except Exception as e:
             self.logger.error(f"解析统计数据失败: {e}")
@@ -625,94 +1656,206 @@ class DataCollector:
     
     def collect_once(self):
         """执行一次数据采集"""
-        self.logger.info("=" * 60)
-        self.logger.info("开始执行数据采集...")
-        self.logger.info(f"采集时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        cycle = self.begin_cycle()
         
-        # 获取分拣进度数据
+        # 获取并保存分拣进度数据
         data = self.fetch_data()
+        stats = self.process_progress_data(data, cycle)
         
-        # 保存分拣进度数据
-        date_str = datetime.now().strftime('%Y%m%d')
-        self.save_to_json(data, date_str)
-        self.save_to_csv(data, date_str)
+        if not self.structured_logs:
+            self.logger.info("")  # 空行分隔
+            self.logger.info("开始获取分拣员排名数据...")
         
-        if data['status'] == 'success':
-            # 解析并显示分拣进度详细信息
-            stats = self.parse_statistics(data.get('data', {}))
-            self.logger.info("✓ 分拣进度数据采集完成")
-            self.logger.info(f"  📊 总任务数: {stats.get('total_tasks', 0)}")
-            self.logger.info(f"  ✅ 已完成: {stats.get('completed_tasks', 0)}")
-            self.logger.info(f"  ⏳ 未完成: {stats.get('uncompleted_tasks', 0)}")
-            self.logger.info(f"  ❌ 缺货: {stats.get('shortage_tasks', 0)}")
-            
-            # 计算并显示完成率
-            if stats.get('total_tasks', 0) > 0:
-                completion_rate = round((stats.get('completed_tasks', 0) / stats.get('total_tasks', 0)) * 100, 1)
-                self.logger.info(f"  📈 完成率: {completion_rate}%")
-            
-            # 显示商户和商品信息
-            if stats.get('merchant_count', 0) > 0:
-                self.logger.info(f"  🏪 商户数: {stats.get('merchant_count', 0)}")
-            if stats.get('product_types', 0) > 0:
-                self.logger.info(f"  📦 商品种类: {stats.get('product_types', 0)}")
-            
-            # 显示计重信息
-            weight_tasks = stats.get('weight_tasks', 0)
-            no_weight_tasks = stats.get('no_weight_tasks', 0)
-            if weight_tasks > 0 or no_weight_tasks > 0:
-                self.logger.info(f"  ⚖️ 计重任务: {weight_tasks} | 不计重任务: {no_weight_tasks}")
-        else:
-            self.logger.error(f"✗ 分拣进度数据采集失败: {data.get('error', '未知错误')}")
+        # 获取并保存分拣员排名数据
+        sorter_rank_data = self.fetch_sorter_rank_data()
+        self.process_sorter_rank_data(sorter_rank_data, cycle)
         
-        self.logger.info("")  # 空行分隔
+        return self.finish_cycle(data, stats, sorter_rank_data, cycle)
+    
+    def begin_cycle(self) -> Dict[str, Any]:
+        """开始一次采集周期，返回用于记录各阶段耗时的周期信息"""
+        if not self.structured_logs:
+            self.logger.info("=" * 60)
+            self.logger.info("开始执行数据采集...")
+            self.logger.info("采集时间: %s", datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        return {'started': time.perf_counter(), 'stages': {}}
+    
+    @contextmanager
+    def timed_stage(self, cycle: Dict[str, Any], stage: str):
+        """记录采集周期中一个处理阶段的耗时（秒）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            cycle['stages'][stage] = cycle['stages'].get(stage, 0) + time.perf_counter() - started
+    
+    def process_progress_data(self, data: Dict[str, Any], cycle: Dict[str, Any]) -> Dict[str, Any]:
+        """保存并解析分拣进度数据，返回统计结果（采集失败时为空）"""
+        # 按数据采集时间归档，回放历史数据时写入原日期的文件
+        date_str = data['timestamp'][:10].replace('-', '')
+        with self.timed_stage(cycle, 'save_progress'):
+            self.save_to_json(data, date_str)
+            self.save_to_csv(data, date_str)
         
-        # 获取分拣员排名数据
-        self.logger.info("开始获取分拣员排名数据...")
-        sorter_rank_data = self.fetch_sorter_rank_data()
+        stats = {}
+        if data['status'] == 'success':
+            with self.timed_stage(cycle, 'parse'):
+                stats = self.parse_statistics(data.get('data', {}))
+        if not self.structured_logs:
+            self.log_progress_summary(data, stats)
+        return stats
+    
+    def process_sorter_rank_data(self, sorter_rank_data: Dict[str, Any], cycle: Dict[str, Any]):
+        """保存分拣员排名数据"""
+        if sorter_rank_data['status'] != 'skipped':
+            date_str = sorter_rank_data['timestamp'][:10].replace('-', '')
+            with self.timed_stage(cycle, 'save_sorter_rank'):
+                self.save_sorter_rank_to_json(sorter_rank_data, date_str)
+                self.save_sorter_rank_to_csv(sorter_rank_data, date_str)
+        if not self.structured_logs:
+            self.log_sorter_summary(sorter_rank_data)
+    
+    def finish_cycle(self, data: Dict[str, Any], stats: Dict[str, Any],
+                     sorter_rank_data: Dict[str, Any], cycle: Dict[str, Any]) -> Dict[str, Any]:
+        """计算告警、更新汇总数据并输出本次采集总结"""
+        snapshot = self.build_snapshot(data, stats, sorter_rank_data)
         
-        # 保存分拣员排名数据
-        self.save_sorter_rank_to_json(sorter_rank_data, date_str)
-        self.save_sorter_rank_to_csv(sorter_rank_data, date_str)
-        
-        if sorter_rank_data['status'] == 'success':
-            # 显示分拣员排名详细信息
-            api_data = sorter_rank_data.get('data', {})
-            if api_data.get('code') == 0 and isinstance(api_data.get('data'), list):
-                sorters = api_data['data']
-                total_completed = sum(sorter.get('statistic_results', 0) for sorter in sorters)
-                self.logger.info("✓ 分拣员排名数据采集完成")
-                self.logger.info(f"  👥 分拣员总数: {len(sorters)}")
-                self.logger.info(f"  📦 总完成件数: {total_completed}")
-                if sorters:
-                    avg_completed = round(total_completed / len(sorters), 1) if len(sorters) > 0 else 0
-                    self.logger.info(f"  📊 平均完成件数: {avg_completed}")
-                    # 显示前3名分拣员
-                    top_sorters = sorted(sorters, key=lambda x: x.get('statistic_results', 0), reverse=True)[:3]
-                    self.logger.info("  🏆 排名前三:")
-                    for i, sorter in enumerate(top_sorters, 1):
-                        self.logger.info(f"    {i}. {sorter.get('sorter_name', '未知')} - {sorter.get('statistic_results', 0)}件")
-        else:
-            self.logger.error(f"✗ 分拣员排名数据采集失败: {sorter_rank_data.get('error', '未知错误')}")
+        # 告警规则检查
+        with self.timed_stage(cycle, 'alerts'):
+            alerts = self.evaluate_alerts(snapshot)
+        
+        # 更新多级汇总数据
+        with self.timed_stage(cycle, 'rollup'):
+            self.update_rollups(snapshot)
         
         # 采集完成总结
-        self.logger.info("")  # 空行分隔
         overall_status = 'success' if data['status'] == 'success' and sorter_rank_data['status'] == 'success' else 'partial_success'
-        if overall_status == 'success':
-            self.logger.info("🎉 本次数据采集全部完成!")
+        if not self.structured_logs:
+            self.logger.info("")  # 空行分隔
+            if overall_status == 'success':
+                self.logger.info("🎉 本次数据采集全部完成!")
+            else:
+                self.logger.info("⚠️ 本次数据采集部分完成")
+            
+            self.logger.info("=" * 60)
+            self.logger.info("")  # 最后的空行分隔
         else:
-            self.logger.info("⚠️ 本次数据采集部分完成")
-        
-        self.logger.info("=" * 60)
-        self.logger.info("")  # 最后的空行分隔
+            self.log_cycle_record(data, stats, sorter_rank_data, alerts, overall_status,
+                                  time.perf_counter() - cycle['started'])
         
         return {
             'sorting_progress': data,
             'sorter_ranking': sorter_rank_data,
             'status': overall_status,
+            'alerts': alerts,
+            'stage_seconds': cycle['stages'],
             'timestamp': datetime.now().isoformat()
         }
     
+    def log_progress_summary(self, data: Dict[str, Any], stats: Dict[str, Any]):
+        """输出分拣进度采集结果（可读文本日志）"""
+        if data['status'] != 'success':
+            self.logger.error("✗ 分拣进度数据采集失败: %s", data.get('error', '未知错误'))
+            return
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        
+        self.logger.info("✓ 分拣进度数据采集完成")
+        self.logger.info(f"  📊 总任务数: {stats.get('total_tasks', 0)}")
+        self.logger.info(f"  ✅ 已完成: {stats.get('completed_tasks', 0)}")
+        self.logger.info(f"  ⏳ 未完成: {stats.get('uncompleted_tasks', 0)}")
+        self.logger.info(f"  ❌ 缺货: {stats.get('shortage_tasks', 0)}")
+        
+        # 计算并显示完成率
+        if stats.get('total_tasks', 0) > 0:
+            completion_rate = round((stats.get('completed_tasks', 0) / stats.get('total_tasks', 0)) * 100, 1)
+            self.logger.info(f"  📈 完成率: {completion_rate}%")
+        
+        # 显示商户和商品信息
+        if stats.get('merchant_count', 0) > 0:
+            self.logger.info(f"  🏪 商户数: {stats.get('merchant_count', 0)}")
+        if stats.get('product_types', 0) > 0:
+            self.logger.info(f"  📦 商品种类: {stats.get('product_types', 0)}")
+        
+        # 显示计重信息
+        weight_tasks = stats.get('weight_tasks', 0)
+        no_weight_tasks = stats.get('no_weight_tasks', 0)
+        if weight_tasks > 0 or no_weight_tasks > 0:
+            self.logger.info(f"  ⚖️ 计重任务: {weight_tasks} | 不计重任务: {no_weight_tasks}")
+    
+    def log_sorter_summary(self, sorter_rank_data: Dict[str, Any]):
+        """输出分拣员排名采集结果（可读文本日志）"""
+        if sorter_rank_data['status'] != 'success':
+            self.logger.error("✗ 分拣员排名数据采集失败: %s", sorter_rank_data.get('error', '未知错误'))
+            return
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        
+        # 显示分拣员排名详细信息
+        api_data = sorter_rank_data.get('data', {})
+        if api_data.get('code') == 0 and isinstance(api_data.get('data'), list):
+            sorters = api_data['data']
+            total_completed = sum(sorter.get('statistic_results', 0) for sorter in sorters)
+            self.logger.info("✓ 分拣员排名数据采集完成")
+            self.logger.info(f"  👥 分拣员总数: {len(sorters)}")
+            self.logger.info(f"  📦 总完成件数: {total_completed}")
+            if sorters:
+                avg_completed = round(total_completed / len(sorters), 1) if len(sorters) > 0 else 0
+                self.logger.info(f"  📊 平均完成件数: {avg_completed}")
+                # 显示前3名分拣员
+                top_sorters = sorted(sorters, key=lambda x: x.get('statistic_results', 0), reverse=True)[:3]
+                self.logger.info("  🏆 排名前三:")
+                for i, sorter in enumerate(top_sorters, 1):
+                    self.logger.info(f"    {i}. {sorter.get('sorter_name', '未知')} - {sorter.get('statistic_results', 0)}件")
+    
+    def log_cycle_record(self, data: Dict[str, Any], stats: Dict[str, Any], sorter_rank_data: Dict[str, Any],
+                         alerts: List[Dict[str, Any]], overall_status: str, duration: float):
+        """输出一条包含本次采集全部关键字段的结构化日志"""
+        level = logging.INFO if overall_status == 'success' else logging.WARNING
+        if not self.logger.isEnabledFor(level):
+            return
+        
+        fields = {
+            'event': 'collect_cycle',
+            'status': overall_status,
+            'duration_ms': round(duration * 1000, 1),
+            'target_date': data['target_date'][:10],
+            'progress_status': data['status'],
+        }
+        if data['status'] == 'success':
+            total = stats.get('total_tasks', 0)
+            fields.update({
+                'total_tasks': total,
+                'completed_tasks': stats.get('completed_tasks', 0),
+                'uncompleted_tasks': stats.get('uncompleted_tasks', 0),
+                'shortage_tasks': stats.get('shortage_tasks', 0),
+                'completion_rate': round(stats.get('completed_tasks', 0) / total * 100, 1) if total > 0 else 0,
+                'merchant_count': stats.get('merchant_count', 0),
+                'product_types': stats.get('product_types', 0),
+                'weight_tasks': stats.get('weight_tasks', 0),
+                'no_weight_tasks': stats.get('no_weight_tasks', 0),
+            })
+        else:
+            fields['progress_error'] = data.get('error', '未知错误')
+        
+        fields['sorter_status'] = sorter_rank_data['status']
+        api_data = sorter_rank_data.get('data', {})
+        if sorter_rank_data['status'] == 'success' and api_data.get('code') == 0 \
+                and isinstance(api_data.get('data'), list):
+            sorters = api_data['data']
+            top_sorters = sorted(sorters, key=lambda x: x.get('statistic_results', 0), reverse=True)[:3]
+            fields.update({
+                'sorter_count': len(sorters),
+                'sorter_total': sum(sorter.get('statistic_results', 0) for sorter in sorters),
+                'top_sorters': [[sorter.get('sorter_name', ''), sorter.get('statistic_results', 0)]
+                                for sorter in top_sorters],
+            })
+        elif sorter_rank_data['status'] != 'success':
+            fields['sorter_error'] = sorter_rank_data.get('error', '未知错误')
+        
+        fields['alerts'] = [alert['rule'] for alert in alerts]
+        self.logger.log(level, "collect_cycle", extra={'fields': fields})
+    
     def start_scheduled_collection(self):
         """启动定时采集"""
         interval = self.config['collection']['interval_minutes']
@@ -732,6 +1875,457 @@ class DataCollector:
             self.logger.info("收到停止信号，正在退出...")
         except Exception as e:
             self.logger.error(f"定时任务执行出错: {e}")
+    
+    def _progress_file_pattern(self):
+        """按配置的文件名格式匹配分拣进度JSON文件，分组1为文件日期"""
+        prefix, _, suffix = self.config['collection']['json_filename'].partition('{date}')
+        return re.compile(re.escape(prefix) + r'(\d{8})' + re.escape(suffix) + '$')
+    
+    def list_progress_files(self, start: str = None, end: str = None, data_dir: str = None) -> List[str]:
+        """列出可能包含[start, end]目标日期数据的分拣进度JSON文件（按日期排序）
+
+        18:00后采集的是次日数据，因此需要多包含开始日期前一天的文件。
+        """
+        data_dir = data_dir or self.config['collection']['data_dir']
+        if not os.path.isdir(data_dir):
+            return []
+        
+        pattern = self._progress_file_pattern()
+        lower = (datetime.strptime(start, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y%m%d') if start else None
+        upper = end.replace('-', '') if end else None
+        
+        files = []
+        for name in os.listdir(data_dir):
+            match = pattern.match(name)
+            if not match:
+                continue
+            file_date = match.group(1)
+            if (lower and file_date < lower) or (upper and file_date > upper):
+                continue
+            files.append((file_date, os.path.join(data_dir, name)))
+        
+        return [filepath for _, filepath in sorted(files)]
+    
+    def _map_files(self, func, filepaths: List[str]) -> Iterator[Any]:
+        """按顺序产出每个文件的处理结果，文件较多时使用多进程并行处理
+
+        最多保留两倍进程数的待取结果，避免结果堆积占用内存。
+        """
+        workers = self.config['report']['workers'] or os.cpu_count() or 1
+        workers = min(workers, len(filepaths))
+        if workers <= 1:
+            yield from map(func, filepaths)
+            return
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for filepath in filepaths:
+                pending.append(executor.submit(func, filepath))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    
+    def iter_report_progress_points(self, start: str = None, end: str = None) -> Iterator[Dict[str, Any]]:
+        """按采集时间顺序流式产出分拣进度曲线数据点
+
+        原始数据和小时汇总可能已按保留天数清理，各数据源覆盖的日期不同。按精度从低到高：
+        rollup_daily.csv（每天一个点）、summary_stats.csv、rollup_hourly.csv（每小时一个点）、
+        sorting_progress_{date}.json（5分钟快照），
+        每个数据源从其最早的目标日期开始，负责到更高精度数据源开始之前的日期。
+        """
+        data_dir = self.config['collection']['data_dir']
+        daily_filepath = os.path.join(data_dir, 'rollup_daily.csv')
+        summary_filepath = os.path.join(data_dir, 'summary_stats.csv')
+        rollup_filepath = os.path.join(data_dir, 'rollup_hourly.csv')
+        
+        def csv_points(filepath):
+            def iterate(low, high):
+                for record in iter_records(filepath):
+                    point = progress_point(record)
+                    if point:
+                        yield point
+            return iterate
+        
+        def json_points(low, high):
+            for result in self._map_files(load_progress_points, self.list_progress_files(low, high)):
+                if result['error']:
+                    self.logger.warning(f"读取文件出错，仅使用可解析部分: {result['error']}")
+                yield from result['points']
+        
+        sources = []
+        first_daily = read_first_record(daily_filepath)
+        if first_daily:
+            sources.append((first_daily.get('目标日期', ''), csv_points(daily_filepath)))
+        first_summary = read_first_record(summary_filepath)
+        if first_summary:
+            sources.append((first_summary.get('目标日期', '')[:10], csv_points(summary_filepath)))
+        first_rollup = read_first_record(rollup_filepath)
+        if first_rollup:
+            sources.append((first_rollup.get('目标日期', ''), csv_points(rollup_filepath)))
+        progress_files = self.list_progress_files()
+        if progress_files:
+            # 前一天的文件已被清理时，最早文件中的目标日期缺少前一天18点后的数据，从次日起才完整
+            first_date = datetime.strptime(
+                self._progress_file_pattern().match(os.path.basename(progress_files[0])).group(1), '%Y%m%d')
+            first_covered = first_date.strftime('%Y-%m-%d')
+            if any(begin < first_covered for begin, _ in sources):
+                first_covered = (first_date + timedelta(days=1)).strftime('%Y-%m-%d')
+            sources.append((first_covered, json_points))
+        
+        for index, (begin, iterate) in enumerate(sources):
+            finer = [later_begin for later_begin, _ in sources[index + 1:]]
+            stop = min(finer) if finer else None
+            if stop is not None and stop <= begin:
+                continue
+            last_day = (datetime.strptime(stop, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d') if stop else None
+            low = max(filter(None, (begin, start)), default=None)
+            high = min(filter(None, (end, last_day)), default=None)
+            if low and high and low > high:
+                continue
+            
+            for point in iterate(low, high):
+                day = point['target_date']
+                if day >= begin and (stop is None or day < stop):
+                    yield point
+    
+    def iter_report_sorter_days(self, start: str = None, end: str = None) -> Iterator[tuple]:
+        """流式汇总分拣员排名，每个周期日期产出一次 (日期, {分拣员: 最终完成件数})
+
+        sorter_rank.json 中已按保留天数清理的日期从 rollup_sorter_daily.csv 读取。
+        """
+        data_dir = self.config['collection']['data_dir']
+        filepath = os.path.join(data_dir, 'sorter_rank.json')
+        first = read_first_record(filepath)
+        raw_begin = (first.get('cycle_start_time') or '')[:10] if isinstance(first, dict) else None
+        
+        rollup_filepath = os.path.join(data_dir, 'rollup_sorter_daily.csv')
+        if os.path.exists(rollup_filepath):
+            current_day, latest = None, {}
+            for row in iter_records(rollup_filepath):
+                day = row.get('目标日期', '')
+                if raw_begin and day >= raw_begin:
+                    break
+                if (start and day < start) or (end and day > end):
+                    continue
+                if day != current_day:
+                    if latest:
+                        yield current_day, latest
+                    current_day, latest = day, {}
+                latest[row.get('分拣员姓名', '')] = _to_int(row.get('完成件数'))
+            if latest:
+                yield current_day, latest
+        
+        if raw_begin is None:
+            return
+        
+        current_day, latest = None, {}
+        try:
+            for record in iter_records(filepath):
+                if not isinstance(record, dict) or record.get('status') != 'success':
+                    continue
+                api_data = record.get('data') or {}
+                if api_data.get('code') != 0 or not isinstance(api_data.get('data'), list):
+                    continue
+                
+                day = (record.get('cycle_start_time') or '')[:10]
+                if (start and day < start) or (end and day > end):
+                    continue
+                if day != current_day:
+                    if latest:
+                        yield current_day, latest
+                    current_day, latest = day, {}
+                
+                # 完成件数为周期内累计值，以最后一次快照为准
+                for sorter in api_data['data']:
+                    latest[sorter.get('sorter_name', '')] = sorter.get('statistic_results', 0)
+        except ValueError as e:
+            self.logger.warning(f"读取分拣员排名文件出错，仅使用可解析部分: {e}")
+        
+        if latest:
+            yield current_day, latest
+    
+    def generate_report(self, start_date: str = None, end_date: str = None) -> Dict[str, Any]:
+        """生成日期范围内的分拣报表
+
+        所有历史文件均以流式方式处理，内存占用不随历史数据量增长：
+        - report_curve_*.csv: 每日完成曲线（每个采集点一行）
+        - report_daily_*.csv: 每日完成情况及缺货汇总
+        - report_sorter_rank_*.csv: 分拣员排名
+        """
+        start = datetime.strptime(start_date.replace('-', ''), '%Y%m%d').strftime('%Y-%m-%d') if start_date else None
+        end = datetime.strptime(end_date.replace('-', ''), '%Y%m%d').strftime('%Y-%m-%d') if end_date else None
+        label = f"{(start or 'begin').replace('-', '')}_{(end or 'end').replace('-', '')}"
+        
+        data_dir = self.config['collection']['data_dir']
+        os.makedirs(data_dir, exist_ok=True)
+        curve_filepath = os.path.join(data_dir, f"report_curve_{label}.csv")
+        daily_filepath = os.path.join(data_dir, f"report_daily_{label}.csv")
+        rank_filepath = os.path.join(data_dir, f"report_sorter_rank_{label}.csv")
+        
+        self.logger.info(f"开始生成报表，日期范围: {start or '最早'} ~ {end or '最新'}")
+        
+        day_count = 0
+        total_shortage = 0
+        
+        with atomic_open(curve_filepath, newline='', encoding='utf-8-sig') as curve_file, \
+                atomic_open(daily_filepath, newline='', encoding='utf-8-sig') as daily_file:
+            curve_writer = csv.writer(curve_file)
+            curve_writer.writerow(['目标日期', '采集时间', '总任务数', '已完成任务数', '缺货任务数', '完成率(%)'])
+            daily_writer = csv.writer(daily_file)
+            daily_writer.writerow(['目标日期', '采集次数', '总任务数', '已完成任务数', '缺货任务数',
+                                   '最高缺货数', '完成率(%)', '完成时间'])
+            
+            def finish_day(summary):
+                rate = round(summary['completed'] / summary['total'] * 100, 1) if summary['total'] > 0 else 0
+                daily_writer.writerow([
+                    summary['target_date'], summary['snapshots'], summary['total'], summary['completed'],
+                    summary['shortage'], summary['peak_shortage'], rate, summary['completed_at']
+                ])
+                self.logger.info(f"  {summary['target_date']}: 完成率 {rate}%, 缺货 {summary['shortage']}, "
+                                 f"完成时间 {summary['completed_at'] or '未完成'}")
+            
+            open_days = {}
+            for point in self.iter_report_progress_points(start, end):
+                day = point['target_date']
+                if not day or (start and day < start) or (end and day > end):
+                    continue
+                
+                rate = round(point['completed'] / point['total'] * 100, 1) if point['total'] > 0 else 0
+                curve_writer.writerow([day, point['timestamp'], point['total'], point['completed'],
+                                       point['shortage'], rate])
+                
+                # 数据点按采集时间有序，目标日期切换后之前的日期不会再有新数据
+                for finished in sorted(d for d in open_days if d < day):
+                    summary = open_days.pop(finished)
+                    finish_day(summary)
+                    day_count += 1
+                    total_shortage += summary['shortage']
+                
+                summary = open_days.setdefault(day, {
+                    'target_date': day, 'snapshots': 0, 'total': 0, 'completed': 0,
+                    'shortage': 0, 'peak_shortage': 0, 'completed_at': ''
+                })
+                # 汇总行代表多次采集，按其记录的采集次数累计
+                summary['snapshots'] += point.get('snapshots', 1)
+                summary['total'] = point['total']
+                summary['completed'] = point['completed']
+                summary['shortage'] = point['shortage']
+                summary['peak_shortage'] = max(summary['peak_shortage'], point.get('peak_shortage', point['shortage']))
+                # 未完成任务清零（已完成+缺货覆盖全部任务）的首个时间点，小时汇总行直接带有完成时间
+                if not summary['completed_at']:
+                    if point.get('completed_at'):
+                        summary['completed_at'] = point['completed_at']
+                    elif point['total'] > 0 and point['completed'] + point['shortage'] >= point['total']:
+                        summary['completed_at'] = point['timestamp'][11:16]
+            
+            for finished in sorted(open_days):
+                summary = open_days.pop(finished)
+                finish_day(summary)
+                day_count += 1
+                total_shortage += summary['shortage']
+        
+        # 分拣员排名：累计每日最终完成件数，规模只与分拣员人数相关
+        sorter_totals = {}
+        for _, latest in self.iter_report_sorter_days(start, end):
+            for name, count in latest.items():
+                totals = sorter_totals.setdefault(name, [0, 0])
+                totals[0] += count
+                totals[1] += 1
+        
+        ranking = sorted(sorter_totals.items(), key=lambda item: item[1][0], reverse=True)
+        with atomic_open(rank_filepath, newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['排名', '分拣员姓名', '总完成件数', '出勤天数', '日均完成件数'])
+            for rank, (name, (total, days)) in enumerate(ranking, 1):
+                writer.writerow([rank, name, total, days, round(total / days, 1) if days else 0])
+        
+        self.logger.info(f"共统计 {day_count} 天，缺货任务合计 {total_shortage}")
+        top_n = self.config['report']['top_n']
+        if ranking:
+            self.logger.info(f"分拣员排名前{min(top_n, len(ranking))}:")
+            for rank, (name, (total, days)) in enumerate(ranking[:top_n], 1):
+                self.logger.info(f"  {rank}. {name} - {total}件 ({days}天)")
+        self.logger.info(f"报表已保存: {curve_filepath}, {daily_filepath}, {rank_filepath}")
+        
+        return {
+            'days': day_count,
+            'total_shortage': total_shortage,
+            'sorter_count': len(ranking),
+            'files': [curve_filepath, daily_filepath, rank_filepath]
+        }
+
+    def iter_replay_cycles(self, source_dir: str) -> Iterator[tuple]:
+        """按采集时间顺序产出历史记录中的 (分拣进度响应, 分拣员排名响应)
+
+        两类数据分别存储，按时间配对：时间不早于该次分拣进度记录、且早于下一次分拣进度记录的
+        第一条排名记录属于同一采集周期；没有对应记录时排名数据标记为 skipped。
+        """
+        def progress_records():
+            for filepath in self.list_progress_files(data_dir=source_dir):
+                for record in iter_records(filepath):
+                    if isinstance(record, dict) and 'timestamp' in record:
+                        yield record
+        
+        rank_filepath = os.path.join(source_dir, 'sorter_rank.json')
+        ranks = iter_records(rank_filepath) if os.path.exists(rank_filepath) else iter(())
+        pending_rank = next(ranks, None)
+        
+        progress = progress_records()
+        current = next(progress, None)
+        while current is not None:
+            following = next(progress, None)
+            
+            # 丢弃早于本次分拣进度记录的孤立排名记录
+            while pending_rank is not None and pending_rank.get('timestamp', '') < current['timestamp']:
+                pending_rank = next(ranks, None)
+            
+            if pending_rank is not None and (following is None or pending_rank.get('timestamp', '') < following['timestamp']):
+                sorter_rank_data = pending_rank
+                pending_rank = next(ranks, None)
+            else:
+                sorter_rank_data = {
+                    'timestamp': current['timestamp'],
+                    'status': 'skipped',
+                    'error': '回放数据中无对应的分拣员排名记录'
+                }
+            
+            yield current, sorter_rank_data
+            current = following
+    
+    def spawn_station(self, data_dir: str) -> 'DataCollector':
+        """创建写入独立数据目录的采集器副本（共用配置、日志和请求会话），用于回放模拟多站点
+
+        回放是离线操作，webhook 告警通道改为写入站点目录下的告警文件。
+        """
+        station = copy.copy(self)
+        station.config = copy.deepcopy(self.config)
+        station.config['collection']['data_dir'] = data_dir
+        sinks = [sink for sink in station.config['alerts'].get('sinks', []) if sink.get('type') != 'webhook']
+        if len(sinks) < len(station.config['alerts'].get('sinks', [])) \
+                and not any(sink.get('type') == 'file' for sink in sinks):
+            sinks.append({'type': 'file', 'filename': 'alerts.csv'})
+        station.config['alerts']['sinks'] = sinks
+        station._lock_file = None
+        os.makedirs(data_dir, exist_ok=True)
+        station.setup_alerts()
+        station.setup_rollups()
+        return station
+    
+    def run_replay(self, source_dir: str, speed: float = None, stations: int = None) -> Dict[str, Any]:
+        """把历史采集记录重新送入完整的采集处理流程（保存、解析、告警、汇总）
+
+        - speed: 相对原始采集间隔的加速倍数，0表示不等待、尽可能快
+        - stations: 每条记录复制到多少个模拟站点，各站点写入独立的子目录
+
+        结束后输出吞吐量及各处理阶段的耗时分布。
+        """
+        replay_config = self.config['replay']
+        speed = replay_config['speed'] if speed is None else speed
+        stations = replay_config['stations'] if stations is None else stations
+        output_dir = replay_config['output_dir']
+        
+        if not os.path.isdir(source_dir):
+            raise ValueError(f"来源目录不存在: {source_dir}")
+        if os.path.abspath(output_dir) == os.path.abspath(source_dir) \
+                or os.path.abspath(output_dir) == os.path.abspath(self.config['collection']['data_dir']):
+            raise ValueError(f"回放输出目录不能与数据来源或采集目录相同: {output_dir}")
+        if os.path.isdir(output_dir) and os.listdir(output_dir):
+            raise ValueError(f"回放输出目录非空，请先清理或在配置中指定其他目录: {output_dir}")
+        
+        station_collectors = [
+            self.spawn_station(os.path.join(output_dir, f"station_{index + 1:03d}"))
+            for index in range(stations)
+        ]
+        
+        self.logger.info(f"开始回放: {source_dir} -> {output_dir}，"
+                         f"加速 {'不限' if not speed else f'{speed}倍'}，模拟站点 {stations} 个")
+        
+        # 逐周期日志会拖慢回放并淹没结果，默认只输出警告及以上级别
+        logger_levels = {}
+        if not replay_config['log_cycles']:
+            for name in (LOGGER_NAME, f"{LOGGER_NAME}.http", f"{LOGGER_NAME}.storage"):
+                logger = logging.getLogger(name)
+                logger_levels[name] = logger.level
+                logger.setLevel(logging.WARNING)
+        
+        # 各阶段耗时：次数、总和、最大值，以及用于计算分位数的固定大小样本
+        sample_size = 10000
+        sampler = random.Random(0)
+        stage_stats = {}
+        
+        def record(stage, seconds):
+            entry = stage_stats.setdefault(stage, {'count': 0, 'total': 0.0, 'max': 0.0, 'samples': []})
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            if len(entry['samples']) < sample_size:
+                entry['samples'].append(seconds)
+            else:
+                index = sampler.randrange(entry['count'])
+                if index < sample_size:
+                    entry['samples'][index] = seconds
+        
+        cycles = 0
+        replay_start = time.perf_counter()
+        first_recorded = None
+        try:
+            for data, sorter_rank_data in self.iter_replay_cycles(source_dir):
+                # 按原始采集时间间隔（除以加速倍数）等待
+                if speed:
+                    recorded = datetime.fromisoformat(data['timestamp'])
+                    first_recorded = first_recorded or recorded
+                    delay = (recorded - first_recorded).total_seconds() / speed \
+                        - (time.perf_counter() - replay_start)
+                    if delay > 0:
+                        time.sleep(delay)
+                
+                for station in station_collectors:
+                    cycle = station.begin_cycle()
+                    stats = station.process_progress_data(data, cycle)
+                    station.process_sorter_rank_data(sorter_rank_data, cycle)
+                    station.finish_cycle(data, stats, sorter_rank_data, cycle)
+                    
+                    for stage, seconds in cycle['stages'].items():
+                        record(stage, seconds)
+                    record('total', time.perf_counter() - cycle['started'])
+                cycles += 1
+        except KeyboardInterrupt:
+            self.logger.info("收到停止信号，回放提前结束")
+        except ValueError as e:
+            self.logger.error(f"回放数据读取中断，仅统计已回放部分: {e}")
+        finally:
+            for name, level in logger_levels.items():
+                logging.getLogger(name).setLevel(level)
+        
+        elapsed = time.perf_counter() - replay_start
+        snapshots = cycles * stations
+        result = {
+            'cycles': cycles,
+            'stations': stations,
+            'snapshots': snapshots,
+            'elapsed_seconds': round(elapsed, 3),
+            'snapshots_per_second': round(snapshots / elapsed, 1) if elapsed > 0 else 0,
+            'stages': {}
+        }
+        
+        self.logger.info(f"回放完成: {cycles} 个采集周期 × {stations} 个站点，耗时 {elapsed:.2f} 秒，"
+                         f"吞吐量 {result['snapshots_per_second']} 次/秒")
+        self.logger.info(f"  {'阶段':<18}{'次数':>8}{'平均(ms)':>12}{'P50(ms)':>12}{'P95(ms)':>12}{'最大(ms)':>12}")
+        for stage, entry in stage_stats.items():
+            samples = sorted(entry['samples'])
+            summary = {
+                'count': entry['count'],
+                'avg_ms': round(entry['total'] / entry['count'] * 1000, 3),
+                'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+                'max_ms': round(entry['max'] * 1000, 3),
+            }
+            result['stages'][stage] = summary
+            self.logger.info(f"  {stage:<18}{summary['count']:>8}{summary['avg_ms']:>12}"
+                             f"{summary['p50_ms']:>12}{summary['p95_ms']:>12}{summary['max_ms']:>12}")
+        
+        return result
 
 def main():
     """主函数"""
@@ -745,6 +2339,9 @@ def main():
     # 检查命令行参数
     if len(sys.argv) > 1:
         if sys.argv[1] == 'test':
+            if not collector.acquire_lock():
+                print("✗ 另一个采集进程正在运行，本次不执行采集")
+                return
             print("\n执行测试模式 - 单次数据采集...")
             result = collector.collect_once()
             print(f"采集结果: {result['status']}")
@@ -754,10 +2351,56 @@ def main():
                 print(f"✗ 数据采集失败: {result.get('error', '未知错误')}")
             return
         elif sys.argv[1] == 'schedule':
+            if not collector.acquire_lock():
+                print("✗ 另一个采集进程正在运行，请勿重复启动")
+                return
             print(f"\n启动定时采集 (间隔: {collector.config['collection']['interval_minutes']} 分钟)")
             print("按 Ctrl+C 停止采集")
             collector.start_scheduled_collection()
             return
+        elif sys.argv[1] == 'report':
+            # 用法: python data_collector.py report [开始日期] [结束日期]，日期格式 YYYYMMDD 或 YYYY-MM-DD
+            start_date = sys.argv[2] if len(sys.argv) > 2 else None
+            end_date = sys.argv[3] if len(sys.argv) > 3 else None
+            for value in (start_date, end_date):
+                try:
+                    if value:
+                        datetime.strptime(value.replace('-', ''), '%Y%m%d')
+                except ValueError:
+                    print(f"✗ 日期格式无效: {value}")
+                    print("用法: python data_collector.py report [开始日期] [结束日期]，日期格式 YYYYMMDD 或 YYYY-MM-DD")
+                    return
+            if start_date and end_date and start_date.replace('-', '') > end_date.replace('-', ''):
+                print(f"✗ 开始日期 {start_date} 晚于结束日期 {end_date}")
+                return
+            print(f"\n生成报表 (日期范围: {start_date or '最早'} ~ {end_date or '最新'})")
+            result = collector.generate_report(start_date, end_date)
+            print(f"✓ 报表生成完成，共 {result['days']} 天")
+            return
+        elif sys.argv[1] == 'replay':
+            # 用法: python data_collector.py replay [来源目录] [加速倍数，0为不限] [模拟站点数]
+            source_dir = sys.argv[2] if len(sys.argv) > 2 else collector.config['collection']['data_dir']
+            try:
+                speed = float(sys.argv[3]) if len(sys.argv) > 3 else None
+                stations = int(sys.argv[4]) if len(sys.argv) > 4 else None
+                if (speed is not None and speed < 0) or (stations is not None and stations < 1):
+                    raise ValueError
+            except ValueError:
+                print(f"✗ 参数无效: {' '.join(sys.argv[3:5])}")
+                print("用法: python data_collector.py replay [来源目录] [加速倍数，0为不限] [模拟站点数，至少1]")
+                return
+            print(f"\n回放历史数据: {source_dir}")
+            try:
+                result = collector.run_replay(source_dir, speed, stations)
+            except ValueError as e:
+                print(f"✗ {e}")
+                return
+            print(f"✓ 回放完成，共 {result['snapshots']} 次，{result['snapshots_per_second']} 次/秒")
+            return
+    
+    if not collector.acquire_lock():
+        print("✗ 另一个采集进程正在运行，请勿重复启动")
+        return
     
     print("选择运行模式:")
     print("1. 执行一次采集")